@@ -1,16 +1,21 @@
+import pathlib
+import sys
+import uuid
+
+# Allow running as `python app/create-collection-qdrant.py` from the repo root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
 from langchain_qdrant import Qdrant  # Use updated package
-from langchain_huggingface import HuggingFaceEmbeddings
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, models
 from qdrant_client.models import VectorParams, Distance
-import uuid
 
-# Initialize embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+from app.embeddings import OnnxEmbeddings
+
+# Initialize embeddings (same ONNX Runtime model as the retriever)
+embeddings = OnnxEmbeddings()
 
 # Connect to Qdrant
-qdrant_client = QdrantClient(url="http://localhost:6333")
+qdrant_client = QdrantClient(host="localhost", grpc_port=6334, prefer_grpc=True)
 collection_name = "incidents"
 
 # Create collection if it doesn't exist
@@ -18,7 +23,15 @@ existing_collections = [col.name for col in qdrant_client.get_collections().coll
 if collection_name not in existing_collections:
     qdrant_client.recreate_collection(
         collection_name=collection_name,
-        vectors_config=VectorParams(size=384, distance=Distance.COSINE)
+        vectors_config=VectorParams(size=384, distance=Distance.COSINE, on_disk=False),
+        # Small collection queried on every request: a denser graph kept resident in RAM
+        hnsw_config=models.HnswConfigDiff(m=32, ef_construct=256, on_disk=False),
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=20000, memmap_threshold=0),
+        # Binary quantization keeps 1 bit per dimension in RAM for HNSW traversal;
+        # switch to models.ScalarQuantization (int8) if recall suffers
+        quantization_config=models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
     )
     print(f"✅ Created collection '{collection_name}'")
 
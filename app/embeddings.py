@@ -0,0 +1,49 @@
+# app/embeddings.py
+import os
+from typing import List, Optional
+
+from fastembed import TextEmbedding
+from langchain_core.embeddings import Embeddings
+
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def default_threads() -> int:
+    if os.getenv("EMBED_THREADS"):
+        return int(os.getenv("EMBED_THREADS"))
+    # one ONNX Runtime session per worker process; don't let N sessions each claim every core
+    workers = int(os.getenv("WEB_CONCURRENCY") or 1)
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    LangChain Embeddings adapter over fastembed's ONNX Runtime TextEmbedding.
+
+    If EMBED_ONNX_PATH points at a directory with an int8-quantized export of
+    the model (see README), those weights are loaded instead of the stock ones.
+    EMBED_THREADS caps ONNX Runtime's intra-op threads per process; by default
+    the CPUs are split evenly across the WEB_CONCURRENCY uvicorn workers.
+    """
+
+    def __init__(self, model_name: str = EMBED_MODEL, model_path: Optional[str] = None, threads: Optional[int] = None):
+        if threads is None:
+            threads = default_threads()
+        self.model = TextEmbedding(
+            model_name,
+            providers=["CPUExecutionProvider"],
+            specific_model_path=model_path or os.getenv("EMBED_ONNX_PATH"),
+            threads=threads,
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [vector.tolist() for vector in self.model.embed(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def warmup(self, batch_size: int = 1):
+        """Runs throwaway forward passes so the first real request doesn't pay for session setup."""
+        self.embed_query("warmup")
+        if batch_size > 1:
+            self.embed_documents(["warmup"] * batch_size)
@@ -1,10 +1,15 @@
 from kafka import KafkaProducer
-import json
+import orjson
 import time
 
+# Batch records for up to 20ms and lz4-compress each batch, so many small logs share one broker round-trip
 producer = KafkaProducer(
     bootstrap_servers=["localhost:9092"],
-    value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+    value_serializer=orjson.dumps,  # returns bytes directly
+    compression_type="lz4",
+    linger_ms=20,
+    batch_size=262_144,
+    acks=1,
 )
 
 logs = [
@@ -12,8 +17,16 @@ logs = [
     {"service": "api", "message": "503 Service Unavailable", "timestamp": time.time()},
 ]
 
-for log in logs:
-    producer.send("incidents", value=log)
-    print(f"Sent: {log}")
+# send() is asynchronous; collect the futures and only check them once everything is flushed
+futures = [producer.send("incidents", value=log) for log in logs]
+producer.flush()
 
-producer.flush()
\ No newline at end of file
+failed = 0
+for future in futures:
+    try:
+        future.get(timeout=0)
+    except Exception as e:
+        failed += 1
+        print(f"Failed to send log: {e}")
+
+print(f"Sent {len(futures) - failed}/{len(futures)} logs")
@@ -1,45 +1,156 @@
 # app/main.py
 import os
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import asyncio
+from contextlib import asynccontextmanager, AsyncExitStack
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
 from dotenv import load_dotenv
+import aioboto3
 
 # Correct initialization for RunnableSequence (using multiple args, not a list)
 from langchain_core.runnables import RunnableSequence, RunnableLambda 
 from langchain_groq import ChatGroq
+from qdrant_client.models import QueryRequest
 
 from app.prompts import incident_prompt
-from app.retriever import get_retriever
+from app.retriever import get_retriever, SEARCH_PARAMS
+from app.query_cache import query_cache
 from app.metrics import start_metrics_server, INCIDENTS_PROCESSED
 
 load_dotenv()
 
-app = FastAPI(title="AI Incident Monitoring RAG Service")
+# ---------------------------
+# Startup / shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global sns_client
+    start_metrics_server()
+    # Pay the embedding model's cold start here rather than on the first incident,
+    # including a full batch so the batched shape is exercised too
+    vector_store.embeddings.warmup(batch_size=query_batcher.max_batch_size)
+    query_batcher.start()
+    print("🚀 RAG service & Prometheus metrics started")
+    async with AsyncExitStack() as stack:
+        # One SNS client (credentials, endpoint, connection pool) for the app's lifetime
+        if SNS_TOPIC_ARN:
+            sns_client = await stack.enter_async_context(
+                sns_session.client("sns", region_name=AWS_REGION)
+            )
+        yield
+        sns_client = None
+    await query_batcher.stop()
+
+app = FastAPI(
+    title="AI Incident Monitoring RAG Service",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # ---------------------------
 # Initialize retriever
 vector_store = get_retriever(as_retriever=False) # <--- REQUIRES CHANGE IN retriever.py
 
+# ---------------------------
+# Initialize Groq LLM once so its HTTP connection pool is reused across requests
+llm = ChatGroq(
+    api_key=os.getenv("GROQ_API_KEY"),
+    model=os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+)
+
+# ---------------------------
+# Micro-batcher: coalesces concurrent queries into one embedding pass + one Qdrant batch query
+class QueryBatcher:
+    def __init__(self, vector_store, max_batch_size: int = 16, max_wait: float = 0.005, top_k: int = 4):
+        self.vector_store = vector_store
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.top_k = top_k
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        """Starts the background batching loop on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancels the batching loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def search(self, query: str) -> List[str]:
+        """Queues a query and waits for the page contents of its top-k documents."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            queries = [query for query, _ in batch]
+            try:
+                results = await asyncio.to_thread(self._search_batch, queries)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), docs in zip(batch, results):
+                if not future.done():
+                    future.set_result(docs)
+
+    def _search_batch(self, queries: List[str]) -> List[List[str]]:
+        # One forward pass for the whole batch, then one round-trip to Qdrant
+        vectors = self.vector_store.embeddings.embed_documents(queries)
+        responses = self.vector_store.client.query_batch_points(
+            collection_name=self.vector_store.collection_name,
+            requests=[
+                QueryRequest(query=vector, limit=self.top_k, params=SEARCH_PARAMS, with_payload=True)
+                for vector in vectors
+            ],
+        )
+        key = self.vector_store.content_payload_key
+        return [[point.payload[key] for point in response.points] for response in responses]
+
+query_batcher = QueryBatcher(vector_store)
+
 # ---------------------------
 # Runnable for retrieving docs & creating string context
-def retrieve_docs(inputs):
+async def retrieve_docs(inputs):
     query = inputs["input"]
-    # USE THE DIRECT SIMILARITY SEARCH METHOD FROM THE VECTORSTORE
-    # This is a common method that is always available on the Qdrant/VectorStore object
-    docs = vector_store.similarity_search(query) 
-    context = "\n".join([doc.page_content for doc in docs])
+    # Alert storms repeat the same text, so skip embedding + Qdrant on a cache hit
+    context = query_cache.get(query)
+    if context is None:
+        docs = await query_batcher.search(query)
+        context = "\n".join(docs)
+        query_cache.set(query, context)
     return {"input": query, "context": context}
 
 retriever_runnable = RunnableLambda(retrieve_docs)
 # ---------------------------
 # Runnable for calling Groq LLM
-def llm_call(inputs):
-    llm = ChatGroq(
-        api_key=os.getenv("GROQ_API_KEY"),
-        model=os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
-    )
-    final_input = incident_prompt.format(input=inputs["input"], context=inputs["context"])
-    return {"analysis": llm.invoke(final_input).content}
+async def llm_call(inputs):
+    messages = incident_prompt.format_messages(input=inputs["input"], context=inputs["context"])
+    response = await llm.ainvoke(messages)
+    return {"analysis": response.content}
 
 llm_runnable = RunnableLambda(llm_call)
 
@@ -48,30 +159,34 @@ llm_runnable = RunnableLambda(llm_call)
 # FIX: Passed runnables as individual arguments, not a list
 rag_chain = RunnableSequence(retriever_runnable, llm_runnable) 
 
+# ---------------------------
+# Shared in-process entry point for /incident and /alert
+async def analyze_incident(message: str):
+    INCIDENTS_PROCESSED.inc()
+    return await rag_chain.ainvoke({"input": message})
+
 # ---------------------------
 # Pydantic schema
 class Incident(BaseModel):
     message: str
 
-# ---------------------------
-# Startup event
-@app.on_event("startup")
-def on_startup():
-    start_metrics_server()
-    print("🚀 RAG service & Prometheus metrics started")
-
 # ---------------------------
 # POST endpoint for incidents
 @app.post("/incident")
 async def handle_incident(incident: Incident):
-    INCIDENTS_PROCESSED.inc()
     try:
-        result = rag_chain.invoke({"input": incident.message})
+        result = await analyze_incident(incident.message)
         return result
     except Exception as e:
         # NOTE: You should consider logging the full exception 'e' here for debugging
         raise HTTPException(status_code=500, detail=str(e))
 
+# ---------------------------
+# Drop cached retrieval results (e.g. after re-ingesting documents) in every worker
+@app.post("/cache/flush")
+async def flush_cache():
+    return {"flushed": query_cache.clear()}
+
 # ---------------------------
 # Health check
 @app.get("/health")
@@ -82,51 +197,66 @@ async def health():
 # Alert 
 # ---------------------------
 # Alert Pydantic models for Alertmanager
-from pydantic import BaseModel
-from typing import List, Dict, Optional
-import httpx
+class AlertmanagerModel(BaseModel):
+    # Alertmanager sends many more fields than we read; ignore them and keep parsed alerts immutable
+    model_config = ConfigDict(extra="ignore", frozen=True)
 
-class AlertLabel(BaseModel):
+class AlertLabel(AlertmanagerModel):
     alertname: str
     severity: Optional[str] = None
     instance: Optional[str] = None
 
-class AlertAnnotation(BaseModel):
+class AlertAnnotation(AlertmanagerModel):
     summary: Optional[str] = None
     description: Optional[str] = None
 
-class Alert(BaseModel):
+class Alert(AlertmanagerModel):
     labels: AlertLabel
     annotations: AlertAnnotation
 
-class AlertManagerPayload(BaseModel):
+class AlertManagerPayload(AlertmanagerModel):
     alerts: List[Alert]
 
 # ---------------------------
 # Updated /alert endpoint using Pydantic
 # ---------------------------
 # ---------------------------
-# At the top, import boto3
-import boto3
-
-# Initialize SNS client
-sns_client = boto3.client(
-    "sns",
-    region_name=os.getenv("AWS_REGION", "us-east-1")  # default region if not in .env
-)
+# Initialize SNS session (aioboto3, non-blocking SNS calls)
+sns_session = aioboto3.Session()
+AWS_REGION = os.getenv("AWS_REGION", "us-east-1")  # default region if not in .env
 SNS_TOPIC_ARN = os.getenv("SNS_TOPIC_ARN")  # set this in your .env file
+sns_client = None  # opened in lifespan when SNS_TOPIC_ARN is set
+
+async def publish_sns_alert(sns, name, description, ai_response):
+    try:
+        subject = f"[AI-RAG Alert] {name}"
+        message = f"Alert: {name}\nDescription: {description}\n\nAI RCA/Analysis:\n{ai_response['analysis']}"
+        await sns.publish(
+            TopicArn=SNS_TOPIC_ARN,
+            Message=message,
+            Subject=subject
+        )
+        print(f"✅ Published alert '{name}' to SNS")
+    except Exception as e:
+        print(f"❌ Failed to send SNS alert for '{name}': {e}")
+
+async def publish_sns_alerts(responses):
+    # Publish all alerts concurrently over the shared SNS client
+    await asyncio.gather(*(
+        publish_sns_alert(sns_client, r["alert"], r["description"], r["ai_recommendation"])
+        for r in responses
+    ))
 
 # ---------------------------
 # Updated /alert endpoint with SNS
 @app.post("/alert")
-async def receive_alert(payload: AlertManagerPayload):
+async def receive_alert(payload: AlertManagerPayload, background_tasks: BackgroundTasks):
     """
     Receives Prometheus alerts from Alertmanager
-    and calls the /incident endpoint automatically.
-    Also sends an email via SNS with the RCA.
+    and runs the incident RAG chain for each alert.
+    Also sends an email via SNS with the RCA in the background.
     """
-    responses = []
-
+    alerts = []
     for alert in payload.alerts:
         # Access Pydantic attributes, not dict keys
         name = alert.labels.alertname
@@ -135,14 +265,18 @@ async def receive_alert(payload: AlertManagerPayload):
             description = f"Alert {name} fired without description"
 
         print(f"🚨 Alert received: {name} — {description}")
+        alerts.append((name, description))
 
-        # Call existing /incident logic on correct port
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                "http://localhost:8081/incident",
-                json={"message": description}
-            )
-            ai_response = resp.json()
+    # Run the RAG chain in-process for all alerts at once so their
+    # retrievals are coalesced by the micro-batcher
+    results = await asyncio.gather(
+        *(analyze_incident(description) for _, description in alerts),
+        return_exceptions=True,
+    )
+
+    responses = []
+    for (name, description), result in zip(alerts, results):
+        ai_response = {"detail": str(result)} if isinstance(result, Exception) else result
 
         responses.append({
             "alert": name,
@@ -150,20 +284,10 @@ async def receive_alert(payload: AlertManagerPayload):
             "ai_recommendation": ai_response
         })
 
-        # ---------------------------
-        # Send email via SNS
-        if SNS_TOPIC_ARN:
-            try:
-                subject = f"[AI-RAG Alert] {name}"
-                message = f"Alert: {name}\nDescription: {description}\n\nAI RCA/Analysis:\n{ai_response['analysis']}"
-                sns_client.publish(
-                    TopicArn=SNS_TOPIC_ARN,
-                    Message=message,
-                    Subject=subject
-                )
-                print(f"✅ Published alert '{name}' to SNS")
-            except Exception as e:
-                print(f"❌ Failed to send SNS alert for '{name}': {e}")
+    # ---------------------------
+    # Send emails via SNS after the response has gone back to Alertmanager
+    if sns_client is not None and responses:
+        background_tasks.add_task(publish_sns_alerts, responses)
 
     return {"processed_alerts": responses}
 
@@ -171,4 +295,15 @@ async def receive_alert(payload: AlertManagerPayload):
 # Run server
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8081)
\ No newline at end of file
+    # One worker by default so the micro-batcher sees all traffic; if WEB_CONCURRENCY > 1,
+    # set PROMETHEUS_MULTIPROC_DIR so counters aggregate across workers
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8081,
+        workers=int(os.getenv("WEB_CONCURRENCY") or 1),
+        loop="uvloop",
+        http="httptools",
+        limit_concurrency=int(os.getenv("LIMIT_CONCURRENCY", "100")),
+        log_level="warning",
+    )
\ No newline at end of file
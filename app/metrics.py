@@ -1,8 +1,23 @@
-from prometheus_client import start_http_server, Counter
+import os
+
+from prometheus_client import start_http_server, Counter, CollectorRegistry, multiprocess
 
 # Metrics
 INCIDENTS_PROCESSED = Counter('incident_processed_total', 'Number of incidents processed')
+RAG_CACHE_HITS = Counter('rag_cache_hits_total', 'Number of retrieval cache hits')
+RAG_CACHE_MISSES = Counter('rag_cache_misses_total', 'Number of retrieval cache misses')
+RAG_CACHE_EVICTIONS = Counter('rag_cache_evictions_total', 'Number of retrieval cache entries evicted for size')
 
 def start_metrics_server(port: int = 8000):
-    start_http_server(port)
-    print(f"📊 Prometheus metrics server started on port {port}")
\ No newline at end of file
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Each uvicorn worker writes its samples to the shared directory; the first
+        # worker to bind the port serves the aggregate, the others skip the server
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        try:
+            start_http_server(port, registry=registry)
+        except OSError:
+            return
+    else:
+        start_http_server(port)
+    print(f"📊 Prometheus metrics server started on port {port}")
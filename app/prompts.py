@@ -1,13 +1,16 @@
 # app/prompts.py
-incident_prompt = """
-You are an AI Incident Monitoring assistant. Analyze the incident message and provide a concise summary 
-or insights using the context below.
-
-Context:
-{context}
+from langchain_core.prompts import ChatPromptTemplate
 
-Incident Message:
-{input}
+# Fixed instructions go first, in their own system message, so providers that
+# cache prompt prefixes can reuse them across requests; only the human message varies
+incident_system_prompt = """
+You are an AI Incident Monitoring assistant. Analyze the incident message and provide a concise summary 
+or insights using the context provided with it.
 
-Answer in a clear and professional way:
+Answer in a clear and professional way.
 """
+
+incident_prompt = ChatPromptTemplate.from_messages([
+    ("system", incident_system_prompt),
+    ("human", "Context:\n{context}\n\nIncident Message:\n{input}"),
+])
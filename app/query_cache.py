@@ -0,0 +1,90 @@
+# app/query_cache.py
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional
+
+from cachetools import TTLCache
+
+from app.metrics import RAG_CACHE_HITS, RAG_CACHE_MISSES, RAG_CACHE_EVICTIONS
+
+
+class _CountingTTLCache(TTLCache):
+    """
+    TTLCache that reports size-based evictions to Prometheus.
+    """
+
+    def popitem(self):
+        item = super().popitem()
+        RAG_CACHE_EVICTIONS.inc()
+        return item
+
+
+class QueryCache:
+    """
+    Thread-safe LRU+TTL cache mapping a query string to its retrieved context.
+
+    Each uvicorn worker has its own cache. A flush replaces the shared marker
+    file, and every worker drops its entries the next time it sees the marker change.
+    """
+
+    def __init__(self, maxsize: int = 2000, ttl: int = 300, flush_marker: Optional[str] = None):
+        self._cache = _CountingTTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.RLock()
+        self._flush_marker = flush_marker
+        self._seen_flush = self._flush_version()
+
+    def _flush_version(self):
+        if not self._flush_marker:
+            return None
+        try:
+            st = os.stat(self._flush_marker)
+        except FileNotFoundError:
+            return None
+        # the marker is atomically replaced on flush, so a new inode/mtime means a new flush
+        return st.st_ino, st.st_mtime_ns
+
+    def _sync(self):
+        version = self._flush_version()
+        if version != self._seen_flush:
+            self._cache.clear()
+            self._seen_flush = version
+
+    @staticmethod
+    def key(query: str) -> str:
+        return hashlib.blake2b(query.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, query: str):
+        with self._lock:
+            self._sync()
+            context = self._cache.get(self.key(query))
+        if context is None:
+            RAG_CACHE_MISSES.inc()
+        else:
+            RAG_CACHE_HITS.inc()
+        return context
+
+    def set(self, query: str, context: str):
+        with self._lock:
+            self._sync()
+            self._cache[self.key(query)] = context
+
+    def clear(self) -> int:
+        """Clears this worker's cache and signals the other workers to clear theirs."""
+        with self._lock:
+            size = len(self._cache)
+            self._cache.clear()
+            if self._flush_marker:
+                tmp_path = f"{self._flush_marker}.{os.getpid()}"
+                with open(tmp_path, "w") as f:
+                    f.write(str(os.getpid()))
+                os.replace(tmp_path, self._flush_marker)
+            self._seen_flush = self._flush_version()
+        return size
+
+
+query_cache = QueryCache(
+    flush_marker=os.getenv("QUERY_CACHE_FLUSH_FILE")
+    or os.path.join(tempfile.gettempdir(), "rag_query_cache.flush")
+)
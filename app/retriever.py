@@ -1,19 +1,25 @@
 # app/retriever.py (MODIFIED)
 from langchain_community.vectorstores import Qdrant
-from langchain_huggingface import HuggingFaceEmbeddings
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, models
 
-# Initialize embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
+from app.embeddings import OnnxEmbeddings
+
+# Initialize embeddings (ONNX Runtime via fastembed)
+embeddings = OnnxEmbeddings()
+
+# Search the binary-quantized vectors, then rescore the oversampled candidates
+# against the original vectors to recover recall; hnsw_ef trades recall for latency
+SEARCH_PARAMS = models.SearchParams(
+    hnsw_ef=64,
+    quantization=models.QuantizationSearchParams(ignore=False, rescore=True, oversampling=2.0)
 )
 
 def get_retriever(as_retriever=True): # <--- Added argument
     """
     Returns a Qdrant vectorstore object or a retriever for the 'incidents' collection.
     """
-    # Connect to your running Qdrant instance
-    qdrant_client = QdrantClient(url="http://qdrant:6333")
+    # Connect to your running Qdrant instance over gRPC (protobuf vectors, no JSON decoding)
+    qdrant_client = QdrantClient(host="qdrant", grpc_port=6334, prefer_grpc=True)
 
     # Initialize the Qdrant vectorstore
     vectorstore = Qdrant(
@@ -4,16 +4,20 @@ s3_to_qdrant.py
 
 Standalone ingestion script:
 - Lists objects under an S3 bucket/prefix
-- Downloads documents locally
+- Skips objects whose current ETag is already fully ingested (unless --force)
+- Downloads documents locally (concurrently)
 - Loads & splits documents into chunks
-- Computes embeddings via HuggingFaceEmbeddings
-- Upserts chunks into Qdrant with deterministic chunk IDs (md5 of key+index)
+- Computes embeddings via fastembed (ONNX Runtime, see app/embeddings.py)
+- Upserts chunks into Qdrant with deterministic chunk IDs (xxh128 of key+index)
+  NOTE: IDs were previously md5-based; points written before the switch are not
+  overwritten, so recreate the collection once before re-ingesting
 
 Usage example:
     export AWS_ACCESS_KEY_ID=...
     export AWS_SECRET_ACCESS_KEY=...
     export AWS_REGION=...
     export QDRANT_URL="http://localhost:6333"
+    export QDRANT_GRPC_PORT=6334
     python s3_to_qdrant.py \
         --bucket my-bucket \
         --prefix rcas/ \
@@ -25,19 +29,22 @@ Usage example:
 import os
 import sys
 import argparse
-import hashlib
 import tempfile
 import pathlib
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Tuple
 
 import boto3
+import xxhash
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
 
-from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance
+from qdrant_client import QdrantClient, models
+from qdrant_client.models import VectorParams, Distance, Filter, FieldCondition, MatchValue
 
-from langchain_huggingface import HuggingFaceEmbeddings
+from app.embeddings import OnnxEmbeddings
 # Use the Qdrant class from langchain-qdrant to match your stack
 from langchain_qdrant import Qdrant
 
@@ -47,13 +54,18 @@ from langchain_community.document_loaders import (
     TextLoader,
     PyPDFLoader,
     UnstructuredMarkdownLoader,
+    Docx2txtLoader,
 )
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+# Built once and shared by every file
+_SPLITTER = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
+
 
 # ---------- Utilities ----------
-def md5_id(s: str) -> str:
-    return hashlib.md5(s.encode("utf-8")).hexdigest()
+def hash_id(s: str) -> str:
+    # non-cryptographic, 128-bit hex digest (valid Qdrant UUID form)
+    return xxhash.xxh128_hexdigest(s.encode("utf-8"))
 
 
 def ensure_local_dir(path: str):
@@ -61,8 +73,11 @@ def ensure_local_dir(path: str):
 
 
 # ---------- S3 Helpers ----------
-def list_s3_objects(bucket: str, prefix: str) -> List[Dict]:
-    s3 = boto3.client("s3")
+# Multipart, multi-threaded transfers for larger objects (e.g. PDFs)
+TRANSFER_CONFIG = TransferConfig(use_threads=True, max_concurrency=10)
+
+
+def list_s3_objects(s3, bucket: str, prefix: str) -> List[Dict]:
     paginator = s3.get_paginator("list_objects_v2")
     objs = []
     for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
@@ -74,18 +89,19 @@ def list_s3_objects(bucket: str, prefix: str) -> List[Dict]:
     return objs
 
 
-def download_s3_object(bucket: str, key: str, dest_dir: str) -> Tuple[str, Dict]:
-    s3 = boto3.client("s3")
+def download_s3_object(s3, bucket: str, obj: Dict, dest_dir: str) -> Tuple[str, Dict]:
+    key = obj["Key"]
+    # flat name that can't escape dest_dir; the key hash keeps same-basename objects apart
+    local_path = os.path.join(dest_dir, f"{hash_id(key)}_{os.path.basename(key)}")
     ensure_local_dir(dest_dir)
-    local_path = os.path.join(dest_dir, os.path.basename(key))
     try:
-        s3.download_file(bucket, key, local_path)
-        head = s3.head_object(Bucket=bucket, Key=key)
+        s3.download_file(bucket, key, local_path, Config=TRANSFER_CONFIG)
+        # listing items already carry these fields, so no HEAD request is needed
         metadata = {
             "Key": key,
-            "LastModified": head.get("LastModified").isoformat() if head.get("LastModified") else None,
-            "Size": head.get("ContentLength"),
-            "ETag": head.get("ETag"),
+            "LastModified": obj.get("LastModified").isoformat() if obj.get("LastModified") else None,
+            "Size": obj.get("Size"),
+            "ETag": obj.get("ETag"),
         }
         return local_path, metadata
     except ClientError as e:
@@ -97,18 +113,18 @@ def download_s3_object(bucket: str, key: str, dest_dir: str) -> Tuple[str, Dict]
 def choose_loader_for_path(path: str):
     suffix = pathlib.Path(path).suffix.lower()
     if suffix == ".pdf":
-        return UnstructuredPDFLoader(path)
-    if suffix in [".docx", ".doc"]:
-        return UnstructuredWordDocumentLoader(path)
+        return PyPDFLoader(path)
+    if suffix == ".docx":
+        return Docx2txtLoader(path)
+    if suffix == ".doc":
+        raise ValueError("legacy .doc files are not supported; convert to .docx")
     # fallback to TextLoader for .txt, .md, .log, etc.
     return TextLoader(path, encoding="utf-8")
 
 
-def load_and_split(path: str, chunk_size: int = 800, chunk_overlap: int = 100):
+def load_and_split(path: str):
     loader = choose_loader_for_path(path)
-    docs = loader.load()
-    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    return splitter.split_documents(docs)
+    return _SPLITTER.split_documents(loader.load())
 
 
 # ---------- Qdrant helpers ----------
@@ -120,45 +136,127 @@ def ensure_qdrant_collection(client: QdrantClient, collection_name: str, vector_
     print(f"Qdrant: creating collection '{collection_name}' (size={vector_size})")
     client.recreate_collection(
         collection_name=collection_name,
-        vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+        vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=False),
+        hnsw_config=models.HnswConfigDiff(m=32, ef_construct=256, on_disk=False),
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=20000, memmap_threshold=0),
+        quantization_config=models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        ),
     )
 
 
-def upsert_chunks_to_qdrant(
-    vectorstore: Qdrant,
-    docs_chunks,
-    s3_key: str,
-    metadata_base: Dict,
-    dry_run: bool = False,
-):
-    texts = []
-    metadatas = []
-    ids = []
+def ensure_payload_indexes(client: QdrantClient, collection_name: str, fields=("s3_key", "filename", "s3_etag")):
+    """Creates keyword indexes so filters on these metadata fields don't scan every payload."""
+    field_names = [f"{Qdrant.METADATA_KEY}.{field}" for field in fields]
+    existing = client.get_collection(collection_name).payload_schema or {}
+    for field_name in field_names:
+        if field_name in existing:
+            continue
+        print(f"Qdrant: creating keyword index on '{field_name}'")
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=models.PayloadSchemaType.KEYWORD,
+            wait=True,
+        )
+
+    indexed = client.get_collection(collection_name).payload_schema or {}
+    missing = [field_name for field_name in field_names if field_name not in indexed]
+    if missing:
+        raise RuntimeError(f"Qdrant: payload indexes not built for {missing}")
+
+
+def is_fully_ingested(client: QdrantClient, collection_name: str, s3_key: str, etag: str) -> bool:
+    """
+    True only if the collection holds exactly this object's current chunk set: every
+    point for the key carries this ETag and there are as many as the ingest produced.
+    Partial writes (failed batches) and leftover chunks from older versions both fail.
+    """
+    key_cond = FieldCondition(key=f"{Qdrant.METADATA_KEY}.s3_key", match=MatchValue(value=s3_key))
+    etag_cond = FieldCondition(key=f"{Qdrant.METADATA_KEY}.s3_etag", match=MatchValue(value=etag))
+    points, _ = client.scroll(
+        collection_name=collection_name,
+        scroll_filter=Filter(must=[key_cond, etag_cond]),
+        limit=1,
+        with_payload=[f"{Qdrant.METADATA_KEY}.s3_chunk_count"],
+        with_vectors=False,
+    )
+    if not points:
+        return False
+    expected = (points[0].payload.get(Qdrant.METADATA_KEY) or {}).get("s3_chunk_count")
+    if expected is None:
+        # written before chunk counts were recorded; re-ingest once to record them
+        return False
+    current = client.count(collection_name, count_filter=Filter(must=[key_cond, etag_cond]), exact=True).count
+    total = client.count(collection_name, count_filter=Filter(must=[key_cond]), exact=True).count
+    return current == expected and total == expected
+
+
+def delete_stale_points(client: QdrantClient, collection_name: str, s3_key: str, etag: str):
+    """Removes an object's chunks left over from older versions (any ETag but the current one)."""
+    client.delete(
+        collection_name=collection_name,
+        points_selector=models.FilterSelector(
+            filter=Filter(
+                must=[FieldCondition(key=f"{Qdrant.METADATA_KEY}.s3_key", match=MatchValue(value=s3_key))],
+                must_not=[FieldCondition(key=f"{Qdrant.METADATA_KEY}.s3_etag", match=MatchValue(value=etag))],
+            )
+        ),
+        wait=True,
+    )
 
+
+def build_chunk_records(docs_chunks, s3_key: str, metadata_base: Dict) -> List[Tuple[str, Dict, str]]:
+    records = []
     for i, chunk in enumerate(docs_chunks):
-        text = chunk.page_content
         # deterministic id so re-ingestion updates the same chunk
-        chunk_id = md5_id(f"{s3_key}::{i}")
+        chunk_id = hash_id(f"{s3_key}::{i}")
         meta = dict(metadata_base)  # copy
         meta.update(
             {
                 "s3_key": s3_key,
                 "filename": metadata_base.get("filename"),
                 "chunk_index": i,
+                # lets the skip check tell a complete ingest from a partial one
+                "s3_chunk_count": len(docs_chunks),
             }
         )
-        texts.append(text)
-        metadatas.append(meta)
-        ids.append(chunk_id)
+        records.append((chunk.page_content, meta, chunk_id))
+    return records
 
-    print(f"Prepared {len(texts)} chunks for s3_key='{s3_key}'.")
-    if dry_run:
-        print("DRY RUN: not writing to Qdrant. Example IDs:", ids[:3])
-        return len(texts)
 
-    # add_texts supports ids and metadatas
-    vectorstore.add_texts(texts=texts, metadatas=metadatas, ids=ids)
-    return len(texts)
+def upsert_records_to_qdrant(
+    client: QdrantClient,
+    collection_name: str,
+    embeddings,
+    records: List[Tuple[str, Dict, str]],
+    batch_size: int = 256,
+    dry_run: bool = False,
+):
+    print(f"Prepared {len(records)} chunks for upsert.")
+    if dry_run:
+        print("DRY RUN: not writing to Qdrant. Example IDs:", [r[2] for r in records[:3]])
+        return len(records)
+
+    # Smart batching: neighbouring texts of similar length minimise padding tokens
+    records = sorted(records, key=lambda r: len(r[0]))
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        batch_texts = [text for text, _, _ in batch]
+        batch_vectors = embeddings.embed_documents(batch_texts)
+        # Same payload layout as langchain's Qdrant.add_texts so the retriever can read it
+        batch_payloads = [{Qdrant.CONTENT_KEY: text, Qdrant.METADATA_KEY: meta} for text, meta, _ in batch]
+        batch_ids = [chunk_id for _, _, chunk_id in batch]
+        # Don't block on each batch being applied; only the last one waits so the
+        # collection is fully written when ingestion reports completion
+        is_last = start + batch_size >= len(records)
+        client.upsert(
+            collection_name=collection_name,
+            points=models.Batch(ids=batch_ids, vectors=batch_vectors, payloads=batch_payloads),
+            wait=is_last,
+        )
+        print(f"Upserted batch of {len(batch)} chunks ({start + len(batch)}/{len(records)})")
+    return len(records)
 
 
 # ---------- Main ingestion ----------
@@ -169,6 +267,9 @@ def ingest_from_s3(
     local_tmp_dir: str = None,
     delete_local: bool = True,
     dry_run: bool = True,
+    batch_size: int = 256,
+    download_workers: int = 16,
+    force: bool = False,
 ):
     if local_tmp_dir is None:
         local_tmp_dir = tempfile.mkdtemp(prefix="s3_ingest_")
@@ -176,48 +277,89 @@ def ingest_from_s3(
         ensure_local_dir(local_tmp_dir)
 
     print(f"Using temporary dir: {local_tmp_dir} (delete_local={delete_local})")
-    s3_objs = list_s3_objects(bucket, prefix)
+    # boto3 clients are thread-safe, so one client is shared by all download workers;
+    # size its connection pool for every worker's multipart requests at once
+    max_pool_connections = download_workers * TRANSFER_CONFIG.max_request_concurrency
+    s3 = boto3.client("s3", config=BotoConfig(max_pool_connections=max_pool_connections))
+    s3_objs = list_s3_objects(s3, bucket, prefix)
     if not s3_objs:
         print(f"No objects found in s3://{bucket}/{prefix}")
         return 0
 
-    # Initialize Qdrant client & embeddings & vectorstore
+    # Initialize Qdrant client & embeddings
     qdrant_url = os.environ.get("QDRANT_URL", "http://localhost:6333")
-    qdrant_client = QdrantClient(url=qdrant_url)
+    qdrant_grpc_port = int(os.environ.get("QDRANT_GRPC_PORT", "6334"))
+    qdrant_client = QdrantClient(url=qdrant_url, grpc_port=qdrant_grpc_port, prefer_grpc=True)
     ensure_qdrant_collection(qdrant_client, collection_name, vector_size=384)
+    ensure_payload_indexes(qdrant_client, collection_name)
+
+    # Skip objects whose current ETag is already fully ingested; nothing to re-embed
+    if not force:
+        with ThreadPoolExecutor(max_workers=download_workers) as executor:
+            up_to_date = list(
+                executor.map(
+                    lambda obj: is_fully_ingested(qdrant_client, collection_name, obj["Key"], obj.get("ETag")),
+                    s3_objs,
+                )
+            )
+        changed_objs = [obj for obj, done in zip(s3_objs, up_to_date) if not done]
+        print(f"Skipping {len(s3_objs) - len(changed_objs)} unchanged objects")
+        s3_objs = changed_objs
+        if not s3_objs:
+            print("Nothing to ingest: all objects are up to date")
+            return 0
+
+    embeddings = OnnxEmbeddings()
+
+    # Chunks from every object are collected first and embedded in large batches
+    records = []
+    processed = []  # (s3_key, etag) of every object whose chunks were prepared
+    with ThreadPoolExecutor(max_workers=download_workers) as executor:
+        futures = {
+            executor.submit(download_s3_object, s3, bucket, obj, local_tmp_dir): obj["Key"]
+            for obj in s3_objs
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            print(f"\nProcessing s3://{bucket}/{key} ...")
+            try:
+                local_path, head_meta = future.result()
+            except Exception as e:
+                print(f"Skipping {key} due to download error: {e}")
+                continue
 
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = Qdrant(client=qdrant_client, collection_name=collection_name, embeddings=embeddings)
-
-    total_chunks = 0
-    for obj in s3_objs:
-        key = obj["Key"]
-        print(f"\nProcessing s3://{bucket}/{key} ...")
-        try:
-            local_path, head_meta = download_s3_object(bucket, key, local_tmp_dir)
-        except Exception as e:
-            print(f"Skipping {key} due to download error: {e}")
-            continue
-
-        try:
-            docs_chunks = load_and_split(local_path)
-            metadata_base = {
-                "filename": pathlib.Path(local_path).name,
-                "s3_last_modified": head_meta.get("LastModified"),
-                "s3_size": head_meta.get("Size"),
-            }
-            count = upsert_chunks_to_qdrant(vectorstore, docs_chunks, key, metadata_base, dry_run=dry_run)
-            total_chunks += count
-            print(f"Upserted {count} chunks for {key}")
-        except Exception as e:
-            print(f"Error processing {local_path}: {e}")
-        finally:
-            if delete_local:
-                try:
-                    os.remove(local_path)
-                except OSError:
-                    pass
+            try:
+                docs_chunks = load_and_split(local_path)
+                metadata_base = {
+                    "filename": os.path.basename(key),
+                    "s3_last_modified": head_meta.get("LastModified"),
+                    "s3_size": head_meta.get("Size"),
+                    "s3_etag": head_meta.get("ETag"),
+                }
+                key_records = build_chunk_records(docs_chunks, key, metadata_base)
+                records.extend(key_records)
+                processed.append((key, head_meta.get("ETag")))
+                print(f"Prepared {len(key_records)} chunks for {key}")
+            except Exception as e:
+                print(f"Error processing {local_path}: {e}")
+            finally:
+                if delete_local:
+                    try:
+                        os.remove(local_path)
+                    except OSError:
+                        pass
+
+    total_chunks = upsert_records_to_qdrant(
+        qdrant_client, collection_name, embeddings, records, batch_size=batch_size, dry_run=dry_run
+    )
 
+    # Only once every new chunk is written, drop chunks from older versions (which may
+    # outnumber the new ones). If anything above failed, the old chunks stay and the
+    # skip check sees an incomplete set, so the next run re-ingests the object.
+    if not dry_run:
+        for key, etag in processed:
+            delete_stale_points(qdrant_client, collection_name, key, etag)
+        print(f"Qdrant: removed stale chunks for {len(processed)} objects")
     print(f"\nIngestion complete. Total chunks processed: {total_chunks}")
     return total_chunks
 
@@ -231,6 +373,9 @@ def parse_args():
     p.add_argument("--local-dir", default=None, help="Local temporary directory (optional)")
     p.add_argument("--no-delete-local", action="store_true", help="Do not delete downloaded local files")
     p.add_argument("--dry-run", action="store_true", help="Prepare but do not write to Qdrant")
+    p.add_argument("--batch-size", type=int, default=256, help="Chunks embedded and upserted per batch")
+    p.add_argument("--download-workers", type=int, default=16, help="Concurrent S3 downloads")
+    p.add_argument("--force", action="store_true", help="Re-ingest objects even if their ETag is unchanged")
     return p.parse_args()
 
 if __name__ == "__main__":
@@ -242,4 +387,7 @@ if __name__ == "__main__":
         local_tmp_dir=args.local_dir,
         delete_local=not args.no_delete_local,
         dry_run=args.dry_run,
+        batch_size=args.batch_size,
+        download_workers=args.download_workers,
+        force=args.force,
     )